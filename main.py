@@ -2,10 +2,13 @@
 # Run: streamlit run app.py
 
 import streamlit as st
+import functools
 import sqlite3
 import hashlib
+import os
+import numpy as np
 import pandas as pd
-import plotly.express as px
+import plotly.graph_objects as go
 from datetime import date
 
 # ---------- Config ----------
@@ -29,6 +32,9 @@ CATEGORIES = [
     "Other",
 ]
 
+# O(1) membership tests; the list above keeps the display order
+CATEGORIES_SET = frozenset(CATEGORIES)
+
 # ---------- DB helpers ----------
 @st.cache_resource
 def get_conn():
@@ -38,9 +44,14 @@ def get_conn():
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             email TEXT UNIQUE NOT NULL,
             password_hash TEXT NOT NULL,
+            salt BLOB,
             created_at TEXT DEFAULT CURRENT_TIMESTAMP
         );
     """)
+    # Databases created before per-user salts lack the column
+    user_cols = [row[1] for row in conn.execute("PRAGMA table_info(users)").fetchall()]
+    if "salt" not in user_cols:
+        conn.execute("ALTER TABLE users ADD COLUMN salt BLOB")
     conn.execute("""
         CREATE TABLE IF NOT EXISTS budgets (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -73,77 +84,343 @@ def get_conn():
         );
     """)
 
+    # Covering indexes so user/category/date filters, GROUP BYs and the
+    # date DESC ordering walk a B-tree instead of scanning the whole table
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tx_user_cat_date ON transactions(user_id, category, date DESC)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tx_user_date ON transactions(user_id, date DESC)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_budgets_user ON budgets(user_id)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_usercats_user ON user_categories(user_id)"
+    )
+
+    # WAL keeps readers unblocked and makes commits a cheap log append
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    # Sorts/temp B-trees in RAM, reads through an mmap'd page cache (256 MB)
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=268435456")
+    # 64 MB page cache stays hot on the long-lived shared connection,
+    # and FK constraints are actually enforced
+    conn.execute("PRAGMA cache_size=-65536")
+    conn.execute("PRAGMA foreign_keys=ON")
+
     conn.commit()
     return conn
 
 
 
-def hash_password(p: str) -> str:
-    # Minimal demo hashing (not for production)
+PBKDF2_ITERATIONS = 200_000
+
+@functools.lru_cache(maxsize=128)
+def hash_password(p: str, salt: bytes) -> str:
+    # PBKDF2-HMAC-SHA256 with a per-user random salt; backed by OpenSSL,
+    # which uses the CPU's SHA instructions where available
+    return hashlib.pbkdf2_hmac("sha256", p.encode("utf-8"), salt, PBKDF2_ITERATIONS).hex()
+
+def hash_password_legacy(p: str) -> str:
+    # Original demo hashing, kept only to verify accounts created before salts
     return hashlib.sha256(("spendwise_salt__" + p).encode("utf-8")).hexdigest()
 
+def verify_password(p: str, stored_hash: str, salt: bytes | None) -> bool:
+    if salt is None:
+        return hash_password_legacy(p) == stored_hash
+    return hash_password(p, salt) == stored_hash
+
 def find_user_by_email(conn, email: str):
-    cur = conn.execute("SELECT id, email, password_hash FROM users WHERE email = ?", (email,))
-    return cur.fetchone()  # (id, email, password_hash) or None
+    cur = conn.execute("SELECT id, email, password_hash, salt FROM users WHERE email = ?", (email,))
+    return cur.fetchone()  # (id, email, password_hash, salt) or None
 
 def create_user(conn, email: str, password: str):
     try:
-        conn.execute(
-            "INSERT INTO users (email, password_hash) VALUES (?, ?)",
-            (email, hash_password(password)),
-        )
-        conn.commit()
+        salt = os.urandom(16)
+        with conn:
+            conn.execute(
+                "INSERT INTO users (email, password_hash, salt) VALUES (?, ?, ?)",
+                (email, hash_password(password, salt), salt),
+            )
         return True, None
     except sqlite3.IntegrityError as e:
         return False, "Email already registered"
 
+def bump_tx_version():
+    # Invalidates the cached transactions dataframe (see load_transactions_df)
+    st.session_state.tx_version = st.session_state.get("tx_version", 0) + 1
+
+def bump_budget_version():
+    # Invalidates the cached budget map (see load_budget_map)
+    st.session_state.budget_version = st.session_state.get("budget_version", 0) + 1
+
+def bump_cat_version():
+    # Invalidates the cached user-category list (see get_user_categories)
+    st.session_state.cat_version = st.session_state.get("cat_version", 0) + 1
+
 def insert_tx(conn, user_id: int, amount: float, category: str, iso_date: str, note: str | None):
-    conn.execute(
-        "INSERT INTO transactions (user_id, amount, category, date, note) VALUES (?, ?, ?, ?, ?)",
-        (user_id, amount, category, iso_date, note or None),
-    )
-    conn.commit()
+    with conn:
+        conn.execute(
+            "INSERT INTO transactions (user_id, amount, category, date, note) VALUES (?, ?, ?, ?, ?)",
+            (user_id, amount, category, iso_date, note or None),
+        )
+    bump_tx_version()
 
 def delete_tx(conn, user_id: int, tx_id: int):
-    conn.execute("DELETE FROM transactions WHERE id = ? AND user_id = ?", (tx_id, user_id))
-    conn.commit()
+    with conn:
+        conn.execute("DELETE FROM transactions WHERE id = ? AND user_id = ?", (tx_id, user_id))
+    bump_tx_version()
 
 def update_tx(conn, user_id: int, tx_id: int, amount: float, category: str, iso_date: str, note: str | None):
-    conn.execute(
-        "UPDATE transactions SET amount=?, category=?, date=?, note=? WHERE id=? AND user_id=?",
-        (amount, category, iso_date, note or None, tx_id, user_id),
-    )
-    conn.commit()
+    with conn:
+        conn.execute(
+            "UPDATE transactions SET amount=?, category=?, date=?, note=? WHERE id=? AND user_id=?",
+            (amount, category, iso_date, note or None, tx_id, user_id),
+        )
+    bump_tx_version()
+
+def bulk_apply(conn, deletes, updates, inserts):
+    # One transaction (and one fsync) for a whole editor diff
+    with conn:
+        conn.executemany("DELETE FROM transactions WHERE id = ? AND user_id = ?", deletes)
+        conn.executemany(
+            "UPDATE transactions SET amount=?, category=?, date=?, note=? WHERE id=? AND user_id=?",
+            updates,
+        )
+        conn.executemany(
+            "INSERT INTO transactions (user_id, amount, category, date, note) VALUES (?, ?, ?, ?, ?)",
+            inserts,
+        )
+    bump_tx_version()
 
 # Insert or update a budget for a specific category
 def upsert_budget(conn, user_id: int, category: str, amount: float):
-    conn.execute(
-        """
-        INSERT INTO budgets (user_id, category, amount)
-        VALUES (?, ?, ?)
-        ON CONFLICT(user_id, category) DO UPDATE SET amount=excluded.amount
-        """,
-        (user_id, category, amount),
-    )
-    conn.commit()
-
-def load_transactions_df(conn, user_id: int) -> pd.DataFrame:
-    df = pd.read_sql_query(
-        "SELECT id, amount, category, date, note FROM transactions WHERE user_id = ? ORDER BY date DESC, id DESC",
-        conn,
-        params=(user_id,),
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO budgets (user_id, category, amount)
+            VALUES (?, ?, ?)
+            ON CONFLICT(user_id, category) DO UPDATE SET amount=excluded.amount
+            """,
+            (user_id, category, amount),
+        )
+    bump_budget_version()
+
+@st.cache_data(show_spinner=False, max_entries=128)
+def load_transactions_df(
+    user_id: int,
+    version: int,
+    cat: str | None = None,
+    from_iso: str | None = None,
+    to_iso: str | None = None,
+) -> pd.DataFrame:
+    # `version` is only part of the cache key: it is bumped on every
+    # insert/update/delete so stale entries are never served.
+    # Category/date filters go into the WHERE clause so only rows that will
+    # actually be displayed are marshaled out of SQLite.
+    # The shared cached connection is fetched inside the body so it never
+    # becomes a cache-key argument (sqlite3.Connection is not hashable).
+    conn = get_conn()
+    where = "user_id = ?"
+    params: list = [user_id]
+    if cat:
+        where += " AND category = ?"
+        params.append(cat)
+    if from_iso:
+        where += " AND date >= ?"
+        params.append(from_iso)
+    if to_iso:
+        where += " AND date <= ?"
+        params.append(to_iso)
+    query = (
+        f"SELECT id, amount, category, date, note FROM transactions WHERE {where} "
+        "ORDER BY date DESC, id DESC"
     )
-    # Ensure correct dtypes
+    n_rows = conn.execute(
+        f"SELECT COUNT(*) FROM transactions WHERE {where}", params
+    ).fetchone()[0]
+    if n_rows > 100_000:
+        # Stream very large histories in chunks instead of one huge cursor fetch
+        df = pd.concat(
+            pd.read_sql_query(query, conn, params=params, chunksize=50_000),
+            ignore_index=True,
+        )
+    else:
+        df = pd.read_sql_query(query, conn, params=params)
+    # amount is REAL in SQLite, so read_sql_query already yields float64;
+    # dates are parsed once here so downstream filtering and charting
+    # compare datetime64 values, not strings
     if not df.empty:
-        df["amount"] = df["amount"].astype(float)
+        df["date"] = pd.to_datetime(df["date"], format="%Y-%m-%d", cache=True)
+        # Categorical codes make category filtering an int compare per row
+        df["category"] = df["category"].astype("category")
     return df
 
-def kpi_from_df(df: pd.DataFrame) -> tuple[float, float, int]:
-    total = float(df["amount"].sum()) if not df.empty else 0.0
-    unique_days = df["date"].nunique() if not df.empty else 1
-    avg_per_day = total / max(unique_days, 1)
-    tx_count = len(df)
-    return total, avg_per_day, tx_count
+def _downsample_daily(frame: pd.DataFrame, max_points: int = 1500) -> pd.DataFrame:
+    """Ограничивает число точек на графике: из каждой корзины строк
+    остаются min и max, чтобы пики не пропадали при прореживании."""
+    if len(frame) <= max_points:
+        return frame
+    bucket = np.arange(len(frame)) // int(np.ceil(len(frame) / max_points))
+    grouped = frame.groupby(bucket)["Daily spending"]
+    keep = np.unique(
+        np.concatenate([grouped.idxmin().to_numpy(), grouped.idxmax().to_numpy()])
+    )
+    return frame.loc[keep]
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def build_daily_forecast(
+    user_id: int,
+    version: int,
+    cat: str | None = None,
+    from_iso: str | None = None,
+    to_iso: str | None = None,
+) -> tuple[pd.DataFrame, pd.DatetimeIndex, float]:
+    """Дневные траты + 7-дневное среднее + плоский прогноз до конца месяца.
+
+    Ключ кеша совпадает с load_transactions_df, так что повторные rerun'ы
+    не пересчитывают resample/rolling.
+    """
+    df = load_transactions_df(user_id, version, cat, from_iso, to_iso)
+    if df.empty:
+        empty = pd.DataFrame(columns=["date", "Daily spending", "7-day MA"])
+        return empty, pd.DatetimeIndex([]), 0.0
+
+    # Daily spending on a calendar grid: resample fills gap days with 0,
+    # so the 7-day MA stays correct when there are days without transactions
+    daily = (
+        df.set_index("date")["amount"]
+        .resample("D")
+        .sum()
+        .rename("Daily spending")
+        .to_frame()
+    )
+    daily["7-day MA"] = daily["Daily spending"].rolling(window=7, min_periods=1).mean()
+    daily = daily.reset_index()
+
+    # Flat forecast to the end of the month using the last 7-day MA
+    last_date = daily["date"].max()
+    last_day_of_month = last_date.to_period("M").to_timestamp("M")
+    if last_day_of_month > last_date:
+        future_dates = pd.date_range(
+            start=last_date + pd.Timedelta(days=1),
+            end=last_day_of_month,
+            freq="D",
+        )
+        forecast_value = float(daily["7-day MA"].iloc[-1])
+    else:
+        future_dates = pd.DatetimeIndex([])
+        forecast_value = 0.0
+
+    return _downsample_daily(daily), future_dates, forecast_value
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def make_pie_fig(
+    user_id: int,
+    version: int,
+    cat: str | None = None,
+    from_iso: str | None = None,
+    to_iso: str | None = None,
+) -> go.Figure:
+    # Cached on the same key as the loader, so reruns that only touch
+    # unrelated widgets reuse the already-serialized figure
+    df = load_transactions_df(user_id, version, cat, from_iso, to_iso)
+    pie_df = df.groupby("category", as_index=False, observed=True)["amount"].sum()
+    # go.Pie straight from the arrays — skips px's dataframe introspection
+    fig = go.Figure(
+        go.Pie(
+            labels=pie_df["category"].to_numpy(),
+            values=pie_df["amount"].to_numpy(),
+            hole=0.35,
+        )
+    )
+    fig.update_layout(legend_title_text="Category")
+    return fig
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def make_forecast_fig(
+    user_id: int,
+    version: int,
+    cat: str | None = None,
+    from_iso: str | None = None,
+    to_iso: str | None = None,
+) -> go.Figure | None:
+    plot_daily, future_dates, forecast_value = build_daily_forecast(
+        user_id, version, cat, from_iso, to_iso
+    )
+    if plot_daily.empty:
+        return None
+    # One trace per series straight from the wide frame — no melt/concat
+    fig = go.Figure()
+    fig.add_scatter(x=plot_daily["date"], y=plot_daily["Daily spending"], name="Daily spending")
+    fig.add_scatter(x=plot_daily["date"], y=plot_daily["7-day MA"], name="7-day MA")
+    if len(future_dates):
+        fig.add_scatter(
+            x=future_dates,
+            y=[forecast_value] * len(future_dates),
+            name="Forecast (daily, 7-day avg)",
+        )
+    fig.update_layout(
+        xaxis_title="Date",
+        yaxis_title="Amount",
+        legend_title="Series",
+    )
+    return fig
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def build_csv_report(
+    user_id: int,
+    version: int,
+    cat: str | None = None,
+    from_iso: str | None = None,
+    to_iso: str | None = None,
+) -> bytes:
+    # CSV с разделителем ';' и BOM, чтобы Excel нормально открыл по столбцам;
+    # кешируется по состоянию фильтров, а не пересобирается на каждый rerun
+    df = load_transactions_df(user_id, version, cat, from_iso, to_iso)
+    return df.to_csv(
+        index=False,
+        sep=";",  # <-- главное: разделитель ; вместо ,
+        date_format="%Y-%m-%d",  # даты храним как datetime64, в отчёте снова ISO
+    ).encode("utf-8-sig")  # <-- BOM, чтобы Excel корректно понял UTF-8
+
+@st.cache_data(show_spinner=False, max_entries=128)
+def load_budget_map(user_id: int, version: int) -> dict[str, float]:
+    # `version` is bumped on every budget upsert/reset, see bump_budget_version
+    rows = get_conn().execute(
+        "SELECT category, amount FROM budgets WHERE user_id = ?", (user_id,)
+    ).fetchall()
+    return {row[0]: float(row[1]) for row in rows}
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def kpi_sql(
+    user_id: int,
+    version: int,
+    cat: str | None = None,
+    from_iso: str | None = None,
+    to_iso: str | None = None,
+) -> tuple[float, float, int]:
+    # Aggregate in SQLite instead of materializing every row in pandas;
+    # same WHERE clause as load_transactions_df so KPIs follow the filters
+    where = "user_id = ?"
+    params: list = [user_id]
+    if cat:
+        where += " AND category = ?"
+        params.append(cat)
+    if from_iso:
+        where += " AND date >= ?"
+        params.append(from_iso)
+    if to_iso:
+        where += " AND date <= ?"
+        params.append(to_iso)
+    total, unique_days, tx_count = get_conn().execute(
+        f"SELECT COALESCE(SUM(amount), 0), COUNT(DISTINCT date), COUNT(*) FROM transactions WHERE {where}",
+        params,
+    ).fetchone()
+    avg_per_day = float(total) / max(unique_days, 1)
+    return float(total), avg_per_day, tx_count
 
 
 
@@ -151,37 +428,48 @@ def kpi_from_df(df: pd.DataFrame) -> tuple[float, float, int]:
 if "user" not in st.session_state:
     st.session_state.user = None  # {"id": int, "email": str}
 
+if "tx_version" not in st.session_state:
+    st.session_state.tx_version = 0
+
+if "budget_version" not in st.session_state:
+    st.session_state.budget_version = 0
+
+if "cat_version" not in st.session_state:
+    st.session_state.cat_version = 0
+
 # ---------- Categories (base + custom) ----------
 
-def get_user_categories(conn, user_id: int) -> list[str]:
-    """Пользовательские категории из таблицы user_categories."""
-    cur = conn.execute(
+@st.cache_data(show_spinner=False, max_entries=64)
+def get_user_categories(user_id: int, version: int) -> list[str]:
+    """Пользовательские категории из таблицы user_categories.
+
+    `version` — токен инвалидации, см. bump_cat_version.
+    """
+    cur = get_conn().execute(
         "SELECT name FROM user_categories WHERE user_id = ? ORDER BY name",
         (user_id,),
     )
     rows = cur.fetchall()
     return [r[0] for r in rows]
 
-def get_all_categories(conn, user_id: int) -> list[str]:
+def get_all_categories(user_id: int) -> list[str]:
     """Базовые + пользовательские категории (без дублей)."""
     base = CATEGORIES.copy()
-    user_cats = get_user_categories(conn, user_id)
+    user_cats = get_user_categories(user_id, st.session_state.get("cat_version", 0))
     for c in user_cats:
-        if c not in base:
+        if c not in CATEGORIES_SET:
             base.append(c)
     return base
 
 
 # -----------> UI: Header <---------------
 
-
-left, right = st.columns([0.8, 0.2])
-with left:
-    st.markdown("## SpendWise")
-with right:
-    # Custom CSS for compact horizontal button
-    st.markdown("""
+# Вся кастомная CSS собрана в одной строке и отправляется одним вызовом
+@st.cache_data
+def _app_css() -> str:
+    return """
         <style>
+        /* Compact horizontal buttons */
         div[data-testid="stVerticalBlock"] button[kind="secondary"],
         div[data-testid="stVerticalBlock"] button {
             writing-mode: horizontal-tb !important;
@@ -192,9 +480,56 @@ with right:
             width: auto !important;
             height: auto !important;
         }
+
+        /* Sidebar styling */
+        [data-testid="stSidebar"] {
+            font-size: 0.9rem;       /* smaller text */
+            line-height: 1.4;        /* compact line spacing */
+        }
+        [data-testid="stSidebar"] h3,
+        [data-testid="stSidebar"] h2,
+        [data-testid="stSidebar"] label {
+            font-size: 0.95rem !important;
+        }
+        [data-testid="stSidebar"] input,
+        [data-testid="stSidebar"] button,
+        [data-testid="stSidebar"] select {
+            font-size: 0.9rem !important;
+        }
+
+        /* Make SET light green */
+        button[kind="primary"][data-testid="baseButton-secondary"] {
+            background-color: #d9fdd3 !important;   /* light green */
+            color: #0b3d0b !important;
+        }
+
+        /* Budget overview cards (colors stay per-card inline) */
+        .budget-card-grid {
+            display: grid;
+            grid-template-columns: repeat(4, 1fr);
+            gap: 0.6rem;
+            margin-bottom: 0.6rem;
+        }
+        .budget-card {
+            border-radius: 6px;
+            padding: 0.5rem 0.6rem;
+            font-size: 0.75rem;
+        }
+
+        /* Make RESET light red */
+        button[kind="secondary"][data-testid="baseButton-secondary"] {
+            background-color: #ffe0e0 !important;   /* light red */
+            color: #7a1414 !important;
+        }
         </style>
-    """, unsafe_allow_html=True)
+    """
 
+st.markdown(_app_css(), unsafe_allow_html=True)
+
+left, right = st.columns([0.8, 0.2])
+with left:
+    st.markdown("## SpendWise")
+with right:
     if st.session_state.user:
         st.markdown(
             f"<div style='text-align:right;font-size:0.9rem;'>"
@@ -203,6 +538,7 @@ with right:
         )
         if st.button("Log out", key="logout_btn_header"):
             st.session_state.user = None
+            hash_password.cache_clear()
             st.success("Signed out")
             st.rerun()
     else:
@@ -214,33 +550,13 @@ conn = get_conn()
 
 # Use sidebar as a persistent, familiar place for auth controls
 with st.sidebar:
-    # --- Style tweaks ---
-    st.markdown("""
-        <style>
-        /* Sidebar styling */
-        [data-testid="stSidebar"] {
-            font-size: 0.9rem;       /* smaller text */
-            line-height: 1.4;        /* compact line spacing */
-        }
-        [data-testid="stSidebar"] h3, 
-        [data-testid="stSidebar"] h2, 
-        [data-testid="stSidebar"] label {
-            font-size: 0.95rem !important;
-        }
-        [data-testid="stSidebar"] input, 
-        [data-testid="stSidebar"] button, 
-        [data-testid="stSidebar"] select {
-            font-size: 0.9rem !important;
-        }
-        </style>
-    """, unsafe_allow_html=True)
-
     # --- Auth panel ---
     st.markdown("### Account")
     if st.session_state.user:
         st.success(f"Signed in as **{st.session_state.user['email']}**")
         if st.button("Log out (sidebar)"):
             st.session_state.user = None
+            hash_password.cache_clear()
             st.success("Signed out")
             st.rerun()
     else:
@@ -252,9 +568,18 @@ with st.sidebar:
                 submitted = st.form_submit_button("Log in")
                 if submitted:
                     row = find_user_by_email(conn, email_in.strip())
-                    if not row or hash_password(pwd_in) != row[2]:
+                    if not row or not verify_password(pwd_in, row[2], row[3]):
                         st.error("Incorrect email or password")
                     else:
+                        if row[3] is None:
+                            # Lazily migrate pre-salt accounts to PBKDF2
+                            # now that the correct password is known
+                            new_salt = os.urandom(16)
+                            with conn:
+                                conn.execute(
+                                    "UPDATE users SET password_hash = ?, salt = ? WHERE id = ?",
+                                    (hash_password(pwd_in, new_salt), new_salt, row[0]),
+                                )
                         st.session_state.user = {"id": row[0], "email": row[1]}
                         st.success("Signed in")
                         st.rerun()
@@ -302,17 +627,18 @@ def handle_add_category():
         st.session_state.add_cat_feedback = ("warning", "Please enter a category name.")
         return
 
-    all_cats_lower = [c.lower() for c in get_all_categories(conn, user_id)]
-    if name.lower() in all_cats_lower:
+    existing_lower = {c.lower() for c in get_all_categories(user_id)}
+    if name.lower() in existing_lower:
         st.session_state.add_cat_feedback = ("info", "This category already exists.")
         return
 
     # пишем в БД
-    conn.execute(
-        "INSERT INTO user_categories (user_id, name) VALUES (?, ?)",
-        (user_id, name),
-    )
-    conn.commit()
+    with conn:
+        conn.execute(
+            "INSERT INTO user_categories (user_id, name) VALUES (?, ?)",
+            (user_id, name),
+        )
+    bump_cat_version()
 
     # сообщение + очистка поля
     st.session_state.add_cat_feedback = ("success", f"Category '{name}' added.")
@@ -353,7 +679,7 @@ with left_col:
 with right_col:
     st.write("Delete an existing category")
 
-    existing_cats = get_all_categories(conn, user_id)
+    existing_cats = get_all_categories(user_id)
 
     if not existing_cats:
         st.caption("There are no categories to display.")
@@ -371,14 +697,15 @@ with right_col:
         )
 
         if delete_cat_clicked:
-            if cat_to_delete in CATEGORIES:
+            if cat_to_delete in CATEGORIES_SET:
                 st.warning("Base categories cannot be deleted.")
             else:
-                conn.execute(
-                    "DELETE FROM user_categories WHERE user_id = ? AND name = ?",
-                    (user_id, cat_to_delete),
-                )
-                conn.commit()
+                with conn:
+                    conn.execute(
+                        "DELETE FROM user_categories WHERE user_id = ? AND name = ?",
+                        (user_id, cat_to_delete),
+                    )
+                bump_cat_version()
                 st.success(f"Category '{cat_to_delete}' deleted.")
 
 
@@ -388,22 +715,6 @@ st.markdown("### Set budget")
 st.write("Set a monthly budget for each category below.")
 
 
-st.markdown("""
-<style>
-/* Make SET light green */
-button[kind="primary"][data-testid="baseButton-secondary"] {
-    background-color: #d9fdd3 !important;   /* light green */
-    color: #0b3d0b !important;
-}
-
-/* Make RESET light red */
-button[kind="secondary"][data-testid="baseButton-secondary"] {
-    background-color: #ffe0e0 !important;   /* light red */
-    color: #7a1414 !important;
-}
-</style>
-""", unsafe_allow_html=True)
-
 with st.form("set_budget_form_budget", clear_on_submit=False):
     # Wrap buttons in a container for CSS targeting
     st.markdown('<div class="budget-form">', unsafe_allow_html=True)
@@ -411,7 +722,7 @@ with st.form("set_budget_form_budget", clear_on_submit=False):
     bc1, bc2, bc3, bc4 = st.columns([1, 1, 1, 1])
 
     # все категории (базовые + добавленные через "Add category")
-    all_categories_for_budget = get_all_categories(conn, user_id)
+    all_categories_for_budget = get_all_categories(user_id)
 
     with bc1:
         budget_category = st.selectbox(
@@ -448,17 +759,19 @@ if set_budget_clicked:
         st.success(f"Budget saved for {budget_category}")
 
 if reset_clicked:
-    conn.execute(
-        "DELETE FROM budgets WHERE user_id = ? AND category = ?",
-        (user_id, budget_category),
-    )
-    conn.commit()
+    with conn:
+        conn.execute(
+            "DELETE FROM budgets WHERE user_id = ? AND category = ?",
+            (user_id, budget_category),
+        )
+    bump_budget_version()
     st.warning(f"Budget reset for {budget_category}")
     st.rerun()
 
 if reset_all_clicked:
-    conn.execute("DELETE FROM budgets WHERE user_id = ?", (user_id,))
-    conn.commit()
+    with conn:
+        conn.execute("DELETE FROM budgets WHERE user_id = ?", (user_id,))
+    bump_budget_version()
     st.warning("All budgets were reset")
     st.rerun()
 
@@ -472,33 +785,33 @@ if reset_all_clicked:
 st.markdown("### Budget overview")
 st.markdown("Here you can see your category budgets and how much you’ve spent.")
 
-# Загружаем бюджеты
-cur_all = conn.execute(
-    "SELECT category, amount FROM budgets WHERE user_id = ?",
-    (user_id,),
-).fetchall()
-
-budget_map = {row[0]: float(row[1]) for row in cur_all}
+# Загружаем бюджеты (из кеша, пока budget_version не изменился)
+budget_map = load_budget_map(user_id, st.session_state.budget_version)
 
 # Получаем все категории (включая кастомные, если они есть)
-all_categories = get_all_categories(conn, user_id)
+all_categories = get_all_categories(user_id)
 
 
 # Разделяем первые 8 и остальные
 first_block = all_categories[:8]
 rest_block = all_categories[8:]
 
+# spent per category in one GROUP BY instead of one SUM query per card
+spent_map = dict(
+    conn.execute(
+        "SELECT category, COALESCE(SUM(amount), 0) FROM transactions WHERE user_id = ? GROUP BY category",
+        (user_id,),
+    ).fetchall()
+)
+
 # --- Функция рисования карточек ---
-def draw_budget_cards(category_list):
-    cols = st.columns(4)
-    for i, cat in enumerate(category_list):
+def draw_budget_cards(category_list, spent_map, budget_map):
+    # Все карточки собираются в одну HTML-строку и отправляются одним
+    # st.markdown вместо отдельного вызова на каждую категорию
+    html_parts = []
+    for cat in category_list:
         # spent
-        cur_s = conn.execute(
-            "SELECT SUM(amount) FROM transactions WHERE user_id = ? AND category = ?",
-            (user_id, cat),
-        )
-        row_s = cur_s.fetchone()
-        spent_val = float(row_s[0]) if row_s and row_s[0] is not None else 0.0
+        spent_val = float(spent_map.get(cat, 0.0))
 
         # budget
         budget_val = budget_map.get(cat, 0.0)
@@ -518,31 +831,25 @@ def draw_budget_cards(category_list):
             bg = "#fce8e6"
             border = "#d93025"
 
-        with cols[i % 4]:
-            st.markdown(
-                f"""
-                <div style="
-                    border:1px solid {border};
-                    background:{bg};
-                    border-radius:6px;
-                    padding:0.5rem 0.6rem;
-                    margin-bottom:0.6rem;
-                    font-size:0.75rem;
-                ">
-                    <b>{cat}</b><br>
-                    {"No budget set" if budget_val == 0 else f"HUF{spent_val:,.2f} / HUF{budget_val:,.2f} ({percent:.1f}%)"}
-                </div>
-                """,
-                unsafe_allow_html=True,
-            )
+        html_parts.append(
+            f'<div class="budget-card" style="border:1px solid {border};background:{bg};">'
+            f"<b>{cat}</b><br>"
+            f'{"No budget set" if budget_val == 0 else f"HUF{spent_val:,.2f} / HUF{budget_val:,.2f} ({percent:.1f}%)"}'
+            f"</div>"
+        )
+
+    st.markdown(
+        f'<div class="budget-card-grid">{"".join(html_parts)}</div>',
+        unsafe_allow_html=True,
+    )
 
 # --- Рисуем первые 8 категорий ---
-draw_budget_cards(first_block)
+draw_budget_cards(first_block, spent_map, budget_map)
 
 # --- Остальные показываем только внутри expander ---
 if rest_block:
     with st.expander("Show more categories", expanded=False):
-        draw_budget_cards(rest_block)
+        draw_budget_cards(rest_block, spent_map, budget_map)
 
 
 
@@ -557,7 +864,7 @@ with st.form("add_tx_form", clear_on_submit=True):
     with c2:
         category = st.selectbox(
             "Category",
-            options=get_all_categories(conn, user_id),
+            options=get_all_categories(user_id),
             key="add_category",
             help="Start typing to search categories",
         )
@@ -576,38 +883,10 @@ with st.form("add_tx_form", clear_on_submit=True):
         else:
             st.error("Please fill amount, category, and date")
 
-st.markdown("### Overview")
-df = load_transactions_df(conn, user_id)
-
-k1, k2, k3 = st.columns(3)
-total, avg_per_day, tx_count = kpi_from_df(df)
-k1.metric("Total Spending", f"HUF{total:,.2f}")
-k2.metric("Avg per Day", f"HUF{avg_per_day:,.2f}")
-k3.metric("Transactions", f"{tx_count}")
-
-# Filters
+# Filters come before the Overview so their values can go straight into
+# the SQL WHERE clause of the loader below
 st.markdown("### Filters")
 
-def apply_filters(
-    _df: pd.DataFrame,
-    cat: str | None,
-    from_dt: date | None,
-    to_dt: date | None,
-) -> pd.DataFrame:
-    out = _df.copy()
-
-    # фильтр по категории (точный выбор из списка)
-    if cat and cat != "All":
-        out = out[out["category"] == cat]
-
-    # фильтры по датам (даты из календаря конвертим в ISO-строку)
-    if from_dt:
-        out = out[out["date"] >= from_dt.isoformat()]
-    if to_dt:
-        out = out[out["date"] <= to_dt.isoformat()]
-
-    return out
-
 # Inputs live inside the expander but we compute df_filtered afterwards (no else!)
 with st.expander("Filters", expanded=False):
     fc1, fc2, fc3 = st.columns(3)
@@ -615,7 +894,7 @@ with st.expander("Filters", expanded=False):
         # выбор категории из списка (включая "All" и кастомные)
         cat_filter = st.selectbox(
             "Category",
-            options=["All"] + get_all_categories(conn, user_id),
+            options=["All"] + get_all_categories(user_id),
             index=0,
             key="cat_filter",
             help="Choose category to filter or All",
@@ -634,12 +913,24 @@ with st.expander("Filters", expanded=False):
             key="to_date",
         )
 
-# Compute filtered dataframe
-df_filtered = apply_filters(
-    df,
-    cat_filter,
-    from_date,
-    to_date,
+# Normalized filter values shared by every query below
+flt_cat = None if cat_filter == "All" else cat_filter
+flt_from = from_date.isoformat() if from_date else None
+flt_to = to_date.isoformat() if to_date else None
+
+st.markdown("### Overview")
+
+k1, k2, k3 = st.columns(3)
+total, avg_per_day, tx_count = kpi_sql(
+    user_id, st.session_state.tx_version, cat=flt_cat, from_iso=flt_from, to_iso=flt_to
+)
+k1.metric("Total Spending", f"HUF{total:,.2f}")
+k2.metric("Avg per Day", f"HUF{avg_per_day:,.2f}")
+k3.metric("Transactions", f"{tx_count}")
+
+# Filtered rows straight from SQLite — only what will actually be shown
+df_filtered = load_transactions_df(
+    user_id, st.session_state.tx_version, cat=flt_cat, from_iso=flt_from, to_iso=flt_to
 )
 
 
@@ -654,75 +945,18 @@ else:
     # ----- LEFT: Spending by Category (pie chart) -----
     with left_col:
         st.subheader("Spending by Category")
-        pie_df = df_filtered.groupby("category", as_index=False)["amount"].sum()
-        fig_pie = px.pie(pie_df, names="category", values="amount", hole=0.35)
-        fig_pie.update_layout(legend_title_text="Category")
+        fig_pie = make_pie_fig(
+            user_id, st.session_state.tx_version, cat=flt_cat, from_iso=flt_from, to_iso=flt_to
+        )
         st.plotly_chart(fig_pie, use_container_width=True)
 
     # ----- RIGHT: 7-day moving average & forecast -----
     with right_col:
         st.subheader("7-day average & forecast")
-
-        ts_df = df_filtered.copy()
-        ts_df["date"] = pd.to_datetime(ts_df["date"])
-
-        # Daily spending
-        daily = (
-            ts_df.groupby("date", as_index=False)["amount"]
-            .sum()
-            .sort_values("date")
-        )
-        daily.rename(columns={"amount": "Daily spending"}, inplace=True)
-
-        # 7-day moving average
-        daily["7-day MA"] = daily["Daily spending"].rolling(window=7, min_periods=1).mean()
-
-        # Last date and last day of the month
-        last_date = daily["date"].max()
-        last_day_of_month = last_date.to_period("M").to_timestamp("M")
-
-        # Build forecast dataframe (flat forecast using last 7-day MA)
-        if last_day_of_month > last_date:
-            future_dates = pd.date_range(
-                start=last_date + pd.Timedelta(days=1),
-                end=last_day_of_month,
-                freq="D",
-            )
-            forecast_value = float(daily["7-day MA"].iloc[-1])
-            forecast_df = pd.DataFrame(
-                {
-                    "date": future_dates,
-                    "Series": "Forecast (daily, 7-day avg)",
-                    "Amount": forecast_value,
-                }
-            )
-        else:
-            forecast_df = pd.DataFrame(columns=["date", "Series", "Amount"])
-
-        # Actual series (daily + 7-day MA) in long format
-        actual_long = pd.melt(
-            daily,
-            id_vars="date",
-            value_vars=["Daily spending", "7-day MA"],
-            var_name="Series",
-            value_name="Amount",
+        fig_forecast = make_forecast_fig(
+            user_id, st.session_state.tx_version, cat=flt_cat, from_iso=flt_from, to_iso=flt_to
         )
-
-        # Combine actual + forecast
-        plot_df = pd.concat([actual_long, forecast_df], ignore_index=True)
-
-        if not plot_df.empty:
-            fig_forecast = px.line(
-                plot_df,
-                x="date",
-                y="Amount",
-                color="Series",
-            )
-            fig_forecast.update_layout(
-                xaxis_title="Date",
-                yaxis_title="Amount",
-                legend_title="Series",
-            )
+        if fig_forecast is not None:
             st.plotly_chart(fig_forecast, use_container_width=True)
         else:
             st.info("Not enough data to build forecast yet.")
@@ -736,11 +970,9 @@ with header_col:
     st.markdown("### Transactions")
 with btn_col:
     if not df_filtered.empty:
-        # CSV с разделителем ';' и BOM, чтобы Excel нормально открыл по столбцам
-        csv_data = df_filtered.to_csv(
-            index=False,
-            sep=";",  # <-- главное: разделитель ; вместо ,
-        ).encode("utf-8-sig")  # <-- BOM, чтобы Excel корректно понял UTF-8
+        csv_data = build_csv_report(
+            user_id, st.session_state.tx_version, cat=flt_cat, from_iso=flt_from, to_iso=flt_to
+        )
 
         st.download_button(
             label="Export report(CSV)",
@@ -749,69 +981,111 @@ with btn_col:
             mime="text/csv",
         )
 
+@st.fragment
+def render_tx_editor(df_filtered: pd.DataFrame, edit_categories: list[str], user_id: int):
+    # Fragment: editing cells reruns only this subtree, not the whole page;
+    # applying a diff escalates to a full-app rerun so KPIs/charts refresh.
+    conn = get_conn()
+
+    editor_df = df_filtered.copy()
+    editor_df["date"] = editor_df["date"].dt.date
+    editor_df["category"] = editor_df["category"].astype(str)  # editor needs plain strings
+
+    edited = st.data_editor(
+        editor_df,
+        num_rows="dynamic",
+        hide_index=True,
+        column_config={
+            "id": st.column_config.NumberColumn("ID", disabled=True),
+            "amount": st.column_config.NumberColumn("Amount", min_value=0.0, step=0.01, format="%.2f"),
+            "category": st.column_config.SelectboxColumn("Category", options=edit_categories),
+            "date": st.column_config.DateColumn("Date", format="YYYY-MM-DD"),
+            "note": st.column_config.TextColumn("Note"),
+        },
+        key="tx_editor",
+        use_container_width=True,
+    )
+
+    def _clean_note(value):
+        return value if isinstance(value, str) and value.strip() else None
+
+    def _row_valid(t) -> bool:
+        # Every cell is clearable in the editor; None/NaN/NaT must not reach
+        # the NOT NULL columns (same guard as the old per-row save form)
+        return (
+            pd.notna(t.amount)
+            and bool(t.amount)
+            and isinstance(t.category, str)
+            and bool(t.category)
+            and pd.notna(t.date)
+        )
+
+    if st.button("Apply changes", key="apply_tx_edits"):
+        orig_by_id = {int(t.id): t for t in editor_df.itertuples(index=False)}
+        seen_ids = set()
+        deletes, updates, inserts = [], [], []
+        invalid_rows = 0
+
+        for t in edited.itertuples(index=False):
+            if pd.isna(t.id):
+                # new row added in the editor
+                if _row_valid(t):
+                    inserts.append(
+                        (user_id, float(t.amount), t.category, t.date.isoformat(), _clean_note(t.note))
+                    )
+                elif (
+                    pd.notna(t.amount)
+                    or (isinstance(t.category, str) and t.category)
+                    or pd.notna(t.date)
+                    or _clean_note(t.note)
+                ):
+                    # partially filled row; an entirely empty one is just ignored
+                    invalid_rows += 1
+                continue
+
+            tx_id = int(t.id)
+            seen_ids.add(tx_id)
+            o = orig_by_id.get(tx_id)
+            if o is None:
+                continue
+
+            if not _row_valid(t):
+                invalid_rows += 1
+                continue
+
+            note = _clean_note(t.note)
+            if (
+                float(t.amount) != float(o.amount)
+                or t.category != o.category
+                or t.date != o.date
+                or note != _clean_note(o.note)
+            ):
+                updates.append((float(t.amount), t.category, t.date.isoformat(), note, tx_id, user_id))
+
+        deletes = [(tx_id, user_id) for tx_id in orig_by_id if tx_id not in seen_ids]
+
+        if invalid_rows:
+            st.error(f"{invalid_rows} row(s) need amount, category, and date — nothing was applied")
+        elif deletes or updates or inserts:
+            bulk_apply(conn, deletes, updates, inserts)
+            st.success("Changes applied")
+            st.rerun(scope="app")
+        else:
+            st.info("No changes to apply.")
+
 if df_filtered.empty:
     st.info("No transactions yet.")
 else:
-    # Show editable table row-by-row
-    for _, row in df_filtered.iterrows():
-        with st.expander(f"{row['date']} — {row['category']} — HUF{row['amount']:.2f}", expanded=False):
-            ec1, ec2, ec3, ec4, ec5 = st.columns([1, 1, 1, 2, 1])
-            with ec1:
-                new_amount = st.number_input(
-                    "Amount",
-                    min_value=0.0,
-                    step=0.01,
-                    format="%.2f",
-                    key=f"edit_amount_{int(row['id'])}",
-                    value=float(row["amount"]),
-                )
-
-            with ec2:
-                edit_categories = get_all_categories(conn, user_id)
-                if row["category"] not in edit_categories:
-                    edit_categories.append(row["category"])
-
-                new_category = st.selectbox(
-                    "Category",
-                    options=edit_categories,
-                    index=edit_categories.index(row["category"]),
-                    key=f"edit_category_{int(row['id'])}",
-                    help="Start typing to search categories",
-                )
-
-            with ec3:
-                # Use text input for ISO flexibility
-                new_date = st.text_input(
-                    "Date (YYYY-MM-DD)",
-                    key=f"edit_date_{int(row['id'])}",
-                    value=row["date"],
-                )
-            with ec4:
-                new_note = st.text_input(
-                    "Note",
-                    key=f"edit_note_{int(row['id'])}",
-                    value=row["note"] if pd.notna(row["note"]) else "",
-                )
-            with ec5:
-                if st.button("Save", key=f"save_{int(row['id'])}"):
-                    if new_amount and new_category and new_date:
-                        update_tx(
-                            conn,
-                            user_id,
-                            int(row["id"]),
-                            float(new_amount),
-                            new_category.strip(),
-                            new_date.strip(),
-                            new_note.strip() if new_note else None,
-                        )
-                        st.success("Updated")
-                        st.rerun()
-                    else:
-                        st.error("Fill amount, category, and date")
-                if st.button("Delete", key=f"delete_{int(row['id'])}"):
-                    delete_tx(conn, user_id, int(row["id"]))
-                    st.warning("Deleted")
-                    st.rerun()
+    # One editable table instead of an expander + 6 widgets per row.
+    # Edits are collected client-side and applied as a single diff inside
+    # the fragment above.
+    edit_categories = get_all_categories(user_id)
+    known_categories = set(edit_categories)
+    for extra in df_filtered["category"].unique():
+        if extra not in known_categories:
+            edit_categories.append(extra)
+
+    render_tx_editor(df_filtered, edit_categories, user_id)
 
 
 # Footer
@@ -820,7 +1094,15 @@ st.caption("SpendWise project • Dubrovskaia Elena (OAC994) • Liu Zerui (RW0K
 # only for report (to show databases)
 st.markdown("## Database Inspection (Debug)")
 
-with st.expander("Show database tables and contents", expanded=False):
+@st.cache_data(ttl=30, show_spinner=False)
+def _debug_table_df(table: str) -> pd.DataFrame:
+    # Short-lived cache: repeated pokes at the inspector within 30s reuse
+    # the frames instead of re-scanning every table
+    return pd.read_sql_query(f"SELECT * FROM {table};", get_conn())
+
+# st.expander executes its body even when collapsed, so the full-table
+# reads below ran on every rerun; a toggle skips them entirely until asked
+if st.toggle("Show database tables and contents", value=False):
     # Show list of all tables
     tables = conn.execute(
         "SELECT name FROM sqlite_master WHERE type='table' ORDER BY name;"
@@ -833,7 +1115,7 @@ with st.expander("Show database tables and contents", expanded=False):
     for table in table_names:
         st.markdown(f"### Table: `{table}`")
         try:
-            df_table = pd.read_sql_query(f"SELECT * FROM {table};", conn)
+            df_table = _debug_table_df(table)
             st.dataframe(df_table)
         except Exception as e:
             st.error(f"Unable to read table {table}: {e}")